@@ -0,0 +1,383 @@
+"""Async client for the photo API.
+
+Example:
+    async with PhotoClient("http://localhost:8000") as client:
+        id = await client.upload_file("img.png")
+        await client.download_file(id, "copy.png")
+
+All requests share one connection pool with keep-alive, and HTTP/2 when the
+server negotiates it. At most max_concurrency uploads and downloads, counting
+each chunk of a file, are in flight at a time across the client. Failed
+requests are retried with exponential backoff. Requests that are not safe to
+repeat, like creating a photo, are only retried when the connection failed
+before the request was sent.
+"""
+import asyncio
+import contextlib
+from os import PathLike
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Awaitable, Iterable, Type, TypeVar
+from uuid import UUID, uuid4
+
+import anyio
+import httpx
+
+from .models import PhotoOut
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+RETRY_STATUS_CODES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+T = TypeVar("T")
+
+
+class PhotoClient:
+    """Async client for the photo API."""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int = 20,
+        max_concurrency: int = 8,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+        http2: bool = True,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """Create a client with its own connection pool.
+
+        Args:
+            base_url (str): The url of the photo API.
+            max_connections (int): The size of the connection pool.
+            max_concurrency (int): The number of uploads, downloads and chunks in flight.
+            retries (int): The number of times a failed request is retried.
+            backoff (float): The delay in seconds before the first retry.
+            timeout (float): The timeout in seconds of each request.
+            http2 (bool): Whether to use HTTP/2 when the server supports it.
+            transport (httpx.AsyncBaseTransport | None): A transport, for testing.
+        """
+        self.max_concurrency = max_concurrency
+        self._transfers = asyncio.Semaphore(max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "PhotoClient":
+        """Open the client.
+
+        Returns:
+            PhotoClient: The client.
+        """
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the client and its connections.
+
+        Args:
+            exc_type (Type[BaseException] | None): The exception type.
+            exc_value (BaseException | None): The exception.
+            traceback (TracebackType | None): The traceback.
+        """
+        await self._client.__aexit__(exc_type, exc_value, traceback)
+
+    async def aclose(self) -> None:
+        """Close the client and its connections."""
+        await self._client.aclose()
+
+    async def _request(
+        self, method: str, url: str, *, idempotent: bool | None = None, **kwargs: Any
+    ) -> httpx.Response:
+        """Send a request, retrying on transport errors and unavailable servers.
+
+        Requests that are not idempotent are only retried if they were never sent.
+        Raises httpx.HTTPStatusError if the response has an error status code,
+        and httpx.TransportError if the request failed after all retries.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The url relative to the base url.
+            idempotent (bool | None): Whether the request is safe to repeat.
+                Defaults to whether the method is idempotent.
+            kwargs (Any): Arguments to httpx.AsyncClient.request.
+
+        Returns:
+            httpx.Response: A successful response.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        retry_errors = (httpx.TransportError,) if idempotent else NOT_SENT_ERRORS
+        for attempt in range(self.retries):
+            with contextlib.suppress(*retry_errors):
+                response = await self._client.request(method, url, **kwargs)
+                if not idempotent or response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+            await asyncio.sleep(self.backoff * 2**attempt)
+        response = await self._client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def _gather(self, aws: Iterable[Awaitable[T]]) -> list[T]:
+        """Run awaitables concurrently, cancelling the rest if one fails.
+
+        The first exception raised by an awaitable is raised once the others
+        have been cancelled.
+
+        Args:
+            aws (Iterable[Awaitable[T]]): The awaitables.
+
+        Returns:
+            list[T]: The results in the same order as the awaitables.
+        """
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_photos(self) -> list[PhotoOut]:
+        """Get a list of photos.
+
+        Returns:
+            list[PhotoOut]: The photos.
+        """
+        response = await self._request("GET", "/photos")
+        return [PhotoOut(**photo) for photo in response.json()]
+
+    async def get_photo(self, id: UUID | str) -> PhotoOut | None:
+        """Get a single photo.
+
+        Args:
+            id (UUID | str): The uuid of the photo.
+
+        Returns:
+            PhotoOut | None: The photo, or None if it is not found.
+
+        Raises:
+            httpx.HTTPStatusError: If the response has another error status code.
+        """
+        try:
+            response = await self._request("GET", f"/photos/{id}")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == httpx.codes.NOT_FOUND:
+                return None
+            raise
+        return PhotoOut(**response.json())
+
+    async def upload(self, content: bytes, filename: str) -> UUID:
+        """Upload a photo in a single request.
+
+        Args:
+            content (bytes): The content of the photo.
+            filename (str): The filename of the photo.
+
+        Returns:
+            UUID: The uuid of the photo.
+        """
+        async with self._transfers:
+            response = await self._request(
+                "POST", "/photos", files={"file": (filename, content)}
+            )
+        return UUID(response.json()["id"])
+
+    async def upload_file(
+        self,
+        path: str | PathLike,
+        *,
+        filename: str | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> UUID:
+        """Upload a photo from a file as a resumable upload.
+
+        The file is read and sent in chunks, in parallel within the client's
+        max_concurrency, so a failed chunk is retried without sending the whole
+        file again. If a chunk fails, the other chunks are cancelled.
+
+        Args:
+            path (str | PathLike): The path to the file.
+            filename (str | None): The filename of the photo. Defaults to the file name.
+            chunk_size (int): The size of each chunk in bytes.
+
+        Returns:
+            UUID: The uuid of the photo.
+        """
+        path = Path(path)
+        size = (await anyio.Path(path).stat()).st_size
+        async with self._transfers:
+            response = await self._request(
+                "POST",
+                "/uploads",
+                json={"filename": filename or path.name, "size": size},
+            )
+        location = response.headers["Location"]
+
+        async def send_chunk(offset: int) -> None:
+            async with self._transfers:
+                async with await anyio.open_file(path, "rb") as f:
+                    await f.seek(offset)
+                    data = await f.read(chunk_size)
+                # The server replaces a chunk sent again to the same offset.
+                await self._request(
+                    "PATCH",
+                    location,
+                    idempotent=True,
+                    content=data,
+                    headers={"Upload-Offset": str(offset)},
+                )
+
+        await self._gather(send_chunk(offset) for offset in range(0, size, chunk_size))
+        return await self._complete_upload(location)
+
+    async def _complete_upload(self, location: str) -> UUID:
+        """Complete an upload, finding the photo if a lost response hid it.
+
+        The photo gets the uuid of the upload. Completing is retried like an
+        idempotent request, and if the upload is gone the photo is looked up.
+
+        Args:
+            location (str): The url of the upload.
+
+        Returns:
+            UUID: The uuid of the photo.
+
+        Raises:
+            httpx.HTTPStatusError: If the upload is gone and no photo was created.
+        """
+        try:
+            async with self._transfers:
+                response = await self._request(
+                    "POST", f"{location}/complete", idempotent=True
+                )
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != httpx.codes.NOT_FOUND:
+                raise
+            id = UUID(location.rsplit("/", 1)[-1])
+            if await self.get_photo(id) is None:
+                raise
+            return id
+        return UUID(response.json()["id"])
+
+    async def upload_files(
+        self,
+        paths: Iterable[str | PathLike],
+        *,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> list[UUID]:
+        """Upload photos from files concurrently, within max_concurrency.
+
+        Args:
+            paths (Iterable[str | PathLike]): The paths to the files.
+            chunk_size (int): The size of each chunk in bytes.
+
+        Returns:
+            list[UUID]: The uuids of the photos, in the same order as the paths.
+        """
+        return await self._gather(
+            self.upload_file(path, chunk_size=chunk_size) for path in paths
+        )
+
+    async def download(self, id: UUID | str) -> bytes:
+        """Download the content of a photo.
+
+        Args:
+            id (UUID | str): The uuid of the photo.
+
+        Returns:
+            bytes: The content of the photo.
+        """
+        async with self._transfers:
+            response = await self._request("GET", f"/photos/{id}/download")
+        return response.content
+
+    async def download_file(self, id: UUID | str, path: str | PathLike) -> Path:
+        """Download a photo to a file without holding it in memory.
+
+        The photo is written to a temporary file next to path, which is renamed
+        to path when the download is complete and removed if it fails. Raises
+        httpx.HTTPStatusError if the response has an error status code, and
+        httpx.TransportError if the download failed after all retries.
+
+        Args:
+            id (UUID | str): The uuid of the photo.
+            path (str | PathLike): The path to the file.
+
+        Returns:
+            Path: The path to the file.
+        """
+        path = Path(path)
+        partial = path.with_name(f".{path.name}.{uuid4().hex}.part")
+        try:
+            for attempt in range(self.retries):
+                with contextlib.suppress(httpx.TransportError):
+                    async with self._transfers:
+                        if await self._stream_to_file(id, partial, last_attempt=False):
+                            break
+                await asyncio.sleep(self.backoff * 2**attempt)
+            else:
+                async with self._transfers:
+                    await self._stream_to_file(id, partial, last_attempt=True)
+            await anyio.Path(partial).replace(path)
+        finally:
+            partial.unlink(missing_ok=True)
+        return path
+
+    async def _stream_to_file(
+        self, id: UUID | str, path: Path, last_attempt: bool
+    ) -> bool:
+        """Stream a photo to a file.
+
+        Args:
+            id (UUID | str): The uuid of the photo.
+            path (Path): The path to the file.
+            last_attempt (bool): Whether an unavailable server is an error.
+
+        Returns:
+            bool: True if the photo was written, False if the server was unavailable.
+        """
+        async with self._client.stream("GET", f"/photos/{id}/download") as response:
+            if response.status_code in RETRY_STATUS_CODES and not last_attempt:
+                return False
+            response.raise_for_status()
+            async with await anyio.open_file(path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    await f.write(chunk)
+        return True
+
+    async def download_files(
+        self, ids: Iterable[UUID | str], directory: str | PathLike
+    ) -> list[Path]:
+        """Download photos to files named by uuid concurrently, within max_concurrency.
+
+        Args:
+            ids (Iterable[UUID | str]): The uuids of the photos.
+            directory (str | PathLike): The directory to download to, created if missing.
+
+        Returns:
+            list[Path]: The paths to the files, in the same order as the uuids.
+        """
+        directory = Path(directory)
+        await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+        return await self._gather(
+            self.download_file(id, directory / str(id)) for id in ids
+        )
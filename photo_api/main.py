@@ -1,15 +1,29 @@
 """Photo API main module."""
 import logging
-from typing import Any
 from uuid import UUID, uuid4
 
-from fastapi import FastAPI, HTTPException, status, UploadFile
+from fastapi import FastAPI, Header, HTTPException, Request, status, UploadFile
 from fastapi.responses import JSONResponse, Response
 
-from .models import Photo, PhotoOut
-from .repository import add_photo, get_photo, get_photos
+from . import profiling
+from .models import MAX_CHUNK_SIZE, Photo, PhotoOut, RequestTrace, Upload, UploadIn
+from .profiling import span
+from .repository import (
+    add_photo,
+    add_upload_chunk,
+    complete_upload,
+    create_upload,
+    delete_upload,
+    get_photo,
+    get_photos,
+    get_upload,
+    UploadConflictError,
+    UploadNotFoundError,
+)
 
 app = FastAPI(debug=True)
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 
 @app.get("/")
@@ -38,21 +52,24 @@ async def post_photo_handler(
     Raises:
         Exception: An exception
     """
-    content = await file.read()
+    with span("upload.read"):
+        content = await file.read()
     filename = file.filename if file.filename else ""
     size = len(content)
     try:
         id = uuid4()
         photo: Photo = Photo(id=id, filename=filename, size=size, content=content)
-        id = await add_photo(photo)
+        with span("repository.add_photo"):
+            id = await add_photo(photo)
     except Exception as e:
         logging.exception(e)
         raise e
-    return JSONResponse(
-        status_code=status_code,
-        content={"id": str(id)},
-        headers={"Location": f"/photos/{str(id)}"},
-    )
+    with span("response.serialize"):
+        return JSONResponse(
+            status_code=status_code,
+            content={"id": str(id)},
+            headers={"Location": f"/photos/{str(id)}"},
+        )
 
 
 @app.get(
@@ -60,32 +77,41 @@ async def post_photo_handler(
     response_model=list[PhotoOut],
     status_code=status.HTTP_200_OK,
 )
-async def get_photos_handler() -> list[PhotoOut]:
+async def get_photos_handler() -> JSONResponse:
     """Get a list of photos.
 
     Returns:
-        list: A dict with a message key.
+        JSONResponse: A list of photos.
 
     Raises:
         Exception: An exception
     """
     try:
-        photos = await get_photos()
+        with span("repository.get_photos"):
+            photos = await get_photos()
     except Exception as e:
         logging.exception(e)
         raise e
-    return photos
+    with span("response.serialize"):
+        return JSONResponse(
+            content=[
+                PhotoOut(**photo.model_dump(exclude={"content"})).model_dump(
+                    mode="json"
+                )
+                for photo in photos
+            ]
+        )
 
 
 @app.get("/photos/{id:str}", response_model=PhotoOut, status_code=status.HTTP_200_OK)
-async def get_photo_handler(id: str) -> Any:
+async def get_photo_handler(id: str) -> JSONResponse:
     """Get a single Photo.
 
     Args:
         id (str): The uuid of the photo.
 
     Returns:
-        Any: A photo with the given uuid.
+        JSONResponse: A photo with the given uuid.
 
     Raises:
         HTTPException: If the photo is not found.
@@ -93,7 +119,8 @@ async def get_photo_handler(id: str) -> Any:
     """
     try:
         UUID(id, version=4)
-        photo = await get_photo(id)
+        with span("repository.get_photo"):
+            photo = await get_photo(id)
         if not photo:
             raise HTTPException(status_code=404, detail="Photo not found.")
     except ValueError as e:
@@ -103,7 +130,12 @@ async def get_photo_handler(id: str) -> Any:
     except Exception as e:
         logging.exception(e)
         raise e from e
-    return photo
+    with span("response.serialize"):
+        return JSONResponse(
+            content=PhotoOut(**photo.model_dump(exclude={"content"})).model_dump(
+                mode="json"
+            )
+        )
 
 
 @app.get(
@@ -126,7 +158,8 @@ async def get_photo_download_handler(id: str) -> Response:
     """
     try:
         UUID(id, version=4)
-        photo = await get_photo(id)
+        with span("repository.get_photo"):
+            photo = await get_photo(id)
         if not photo:
             raise HTTPException(status_code=404, detail="Photo not found")
     except ValueError as e:
@@ -137,7 +170,269 @@ async def get_photo_download_handler(id: str) -> Response:
         logging.exception(e)
         raise e
 
-    return Response(
-        content=photo.content,
-        media_type="image/png",
-    )
+    with span("response.serialize"):
+        return Response(
+            content=photo.content,
+            media_type="image/png",
+        )
+
+
+@app.post("/uploads")
+async def post_upload_handler(
+    body: UploadIn, status_code: int = status.HTTP_201_CREATED
+) -> JSONResponse:
+    """Start a resumable upload.
+
+    Args:
+        body (UploadIn): The filename and total size of the upload.
+        status_code (int): The status code. Defaults to status.HTTP_201_CREATED.
+
+    Returns:
+        JSONResponse: A response with location header.
+
+    Raises:
+        Exception: An exception
+    """
+    try:
+        upload = Upload(id=uuid4(), filename=body.filename, size=body.size)
+        with span("repository.create_upload"):
+            id = await create_upload(upload)
+    except Exception as e:
+        logging.exception(e)
+        raise e
+    with span("response.serialize"):
+        return JSONResponse(
+            status_code=status_code,
+            content={"id": str(id)},
+            headers={"Location": f"/uploads/{str(id)}"},
+        )
+
+
+@app.head("/uploads/{id:str}", status_code=status.HTTP_200_OK)
+async def head_upload_handler(id: str) -> Response:
+    """Get the received offset of an upload.
+
+    Args:
+        id (str): The uuid of the upload.
+
+    Returns:
+        Response: A response with Upload-Offset and Upload-Length headers.
+
+    Raises:
+        HTTPException: If the upload is not found.
+        Exception: An exception
+    """
+    try:
+        UUID(id, version=4)
+        with span("repository.get_upload"):
+            upload = await get_upload(id)
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload not found.")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid uuid in path parameter: {id}."
+        ) from e
+    except Exception as e:
+        logging.exception(e)
+        raise e
+    with span("response.serialize"):
+        return Response(
+            headers={
+                "Upload-Offset": str(upload.offset),
+                "Upload-Length": str(upload.size),
+                "Cache-Control": "no-store",
+            },
+        )
+
+
+async def _read_chunk(request: Request, offset: int, upload: Upload) -> bytes:
+    """Read a chunk from the request body, rejecting it once it is too long.
+
+    Args:
+        request (Request): The request with the chunk as body.
+        offset (int): The offset of the chunk in the upload.
+        upload (Upload): The upload the chunk belongs to.
+
+    Returns:
+        bytes: The chunk.
+
+    Raises:
+        HTTPException: If the chunk is larger than MAX_CHUNK_SIZE, or does not fit.
+    """
+    if offset < 0 or offset > upload.size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Offset {offset} is outside upload of {upload.size}.",
+        )
+    length = int(request.headers.get("Content-Length", 0))
+    data = bytearray()
+    stream = request.stream()
+    # Check the declared length before reading, then each time the body grows.
+    while True:
+        if length > MAX_CHUNK_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunk is larger than {MAX_CHUNK_SIZE} bytes.",
+            )
+        if offset + length > upload.size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Chunk at {offset} is longer than upload of {upload.size}.",
+            )
+        body = await anext(stream, None)
+        if body is None:
+            return bytes(data)
+        data += body
+        length = max(length, len(data))
+
+
+@app.patch("/uploads/{id:str}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_upload_handler(
+    id: str, request: Request, upload_offset: int = Header()  # noqa: B008
+) -> Response:
+    """Write a chunk of an upload.
+
+    Chunks may be sent in any order and in parallel, and a chunk sent again
+    at the same offset replaces the previous one. The chunk is checked against
+    MAX_CHUNK_SIZE and the size of the upload before and while it is read.
+
+    Args:
+        id (str): The uuid of the upload.
+        request (Request): The request with the chunk as body.
+        upload_offset (int): The offset of the chunk, from the Upload-Offset header.
+
+    Returns:
+        Response: A response with the received offset in the Upload-Offset header.
+
+    Raises:
+        HTTPException: If the upload is not found, or the chunk does not fit.
+        Exception: An exception
+    """
+    try:
+        UUID(id, version=4)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid uuid in path parameter: {id}."
+        ) from e
+    with span("repository.get_upload"):
+        upload = await get_upload(id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    with span("upload.read"):
+        data = await _read_chunk(request, upload_offset, upload)
+    try:
+        with span("repository.add_upload_chunk"):
+            offset = await add_upload_chunk(id, upload_offset, data)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail="Upload not found.") from e
+    except UploadConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        logging.exception(e)
+        raise e
+    with span("response.serialize"):
+        return Response(
+            status_code=status.HTTP_204_NO_CONTENT,
+            headers={"Upload-Offset": str(offset)},
+        )
+
+
+@app.post("/uploads/{id:str}/complete")
+async def post_upload_complete_handler(
+    id: str, status_code: int = status.HTTP_201_CREATED
+) -> JSONResponse:
+    """Turn a fully received upload into a photo.
+
+    The photo gets the uuid of the upload. A client that lost the response can
+    then find the photo, after a retry fails because the upload is gone.
+
+    Args:
+        id (str): The uuid of the upload.
+        status_code (int): The status code. Defaults to status.HTTP_201_CREATED.
+
+    Returns:
+        JSONResponse: A response with location header of the photo.
+
+    Raises:
+        HTTPException: If the upload is not found or not fully received.
+        Exception: An exception
+    """
+    try:
+        UUID(id, version=4)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid uuid in path parameter: {id}."
+        ) from e
+    try:
+        with span("repository.complete_upload"):
+            photo_id = await complete_upload(id)
+    except UploadNotFoundError as e:
+        raise HTTPException(status_code=404, detail="Upload not found.") from e
+    except UploadConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except Exception as e:
+        logging.exception(e)
+        raise e
+    with span("response.serialize"):
+        return JSONResponse(
+            status_code=status_code,
+            content={"id": str(photo_id)},
+            headers={"Location": f"/photos/{str(photo_id)}"},
+        )
+
+
+@app.delete("/uploads/{id:str}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload_handler(id: str) -> Response:
+    """Abandon an upload.
+
+    Args:
+        id (str): The uuid of the upload.
+
+    Returns:
+        Response: An empty response.
+
+    Raises:
+        HTTPException: If the upload is not found.
+        Exception: An exception
+    """
+    try:
+        UUID(id, version=4)
+        with span("repository.delete_upload"):
+            deleted = await delete_upload(id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Upload not found.")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid uuid in path parameter: {id}."
+        ) from e
+    except Exception as e:
+        logging.exception(e)
+        raise e
+    with span("response.serialize"):
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get(
+    profiling.ADMIN_PATH,
+    response_model=list[RequestTrace],
+    status_code=status.HTTP_200_OK,
+)
+async def get_slow_requests_handler(
+    x_profiling_token: str | None = Header(default=None),  # noqa: B008
+) -> list[RequestTrace]:
+    """Get the most recent profiled and slow requests, newest first.
+
+    Args:
+        x_profiling_token (str | None): The profiling token from the request header.
+
+    Returns:
+        list[RequestTrace]: The traced requests in the ring buffer.
+
+    Raises:
+        HTTPException: If the profiling token is missing or wrong.
+    """
+    if not profiling.is_authorized(x_profiling_token):
+        raise HTTPException(status_code=404, detail="Not found.")
+    return list(reversed(profiling.slow_requests))
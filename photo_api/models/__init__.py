@@ -1,2 +1,4 @@
 """Models package for photo_api."""
 from .photo import Photo, PhotoOut
+from .trace import RequestTrace, Span
+from .upload import MAX_CHUNK_SIZE, Upload, UploadIn
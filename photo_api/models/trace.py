@@ -0,0 +1,28 @@
+"""Request trace model."""
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class Span(BaseModel):
+    """Span model."""
+
+    name: str
+    start_ms: float
+    duration_ms: float
+
+
+class RequestTrace(BaseModel):
+    """Request trace model."""
+
+    id: UUID
+    timestamp: datetime
+    method: str
+    path: str
+    status_code: int
+    duration_ms: float
+    spans: list[Span]
+    profile: str | None = Field(
+        default=None, description="cProfile statistics, if the request was profiled."
+    )
@@ -0,0 +1,26 @@
+"""Upload model."""
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+# Completed uploads are assembled into a single bytea value, which Postgres
+# limits to 1 GB.
+MAX_UPLOAD_SIZE = 1000 * 1000 * 1000
+# Chunks are held in memory while they are written to the database.
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class UploadIn(BaseModel):
+    """Upload model."""
+
+    filename: str
+    size: int = Field(ge=0, le=MAX_UPLOAD_SIZE)
+
+
+class Upload(BaseModel):
+    """Upload model."""
+
+    id: UUID
+    filename: str
+    size: int
+    offset: int = 0
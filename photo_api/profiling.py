@@ -0,0 +1,264 @@
+"""Opt-in request profiling and slow-request tracing.
+
+Profiling is disabled unless at least one of the following environment
+variables is set:
+
+- PROFILING_TOKEN: requests carrying this value in the X-Profiling-Token
+  header are profiled. The same token guards the admin endpoint.
+- PROFILING_SAMPLE_RATE: fraction (0.0 - 1.0) of requests to profile.
+- SLOW_REQUEST_THRESHOLD_MS: requests slower than this are recorded.
+
+Only requests that are profiled are traced, unless SLOW_REQUEST_THRESHOLD_MS
+is set, in which case every request is timed. Traced requests are kept in a
+ring buffer of SLOW_REQUEST_BUFFER_SIZE entries.
+
+cProfile profiles the whole thread, not a single request. A request is
+therefore only profiled while it is the only request in flight, and the
+profiler is stopped as soon as another request starts, so other requests never
+run under the profiler.
+"""
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+from datetime import datetime, timezone
+import io
+import os
+import pstats
+import random
+import secrets
+import time
+from typing import Iterator
+from uuid import uuid4
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .models import RequestTrace, Span
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", 0))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", 100))
+PROFILING_ENABLED = bool(
+    PROFILING_TOKEN or PROFILING_SAMPLE_RATE > 0 or SLOW_REQUEST_THRESHOLD_MS > 0
+)
+
+ADMIN_PATH = "/admin/slow-requests"
+PROFILING_TOKEN_HEADER = "X-Profiling-Token"  # noqa: S105
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_STATS_LINES = 30
+PROFILE_INTERRUPTED = "Profile stopped early: another request started.\n"
+
+slow_requests: deque[RequestTrace] = deque(maxlen=SLOW_REQUEST_BUFFER_SIZE)
+
+
+class _Trace:
+    """Spans collected for the request being handled."""
+
+    def __init__(self) -> None:
+        """Start the trace clock."""
+        self.start = time.perf_counter()
+        self.spans: list[Span] = []
+
+
+_current_trace: ContextVar[_Trace | None] = ContextVar("_current_trace", default=None)
+_in_flight = 0
+_profiler: cProfile.Profile | None = None
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block of code within the current request trace.
+
+    This is a no-op when the current request is not traced.
+
+    Args:
+        name (str): The name of the span.
+
+    Yields:
+        None: Control to the timed block.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        trace.spans.append(
+            Span(
+                name=name,
+                start_ms=(start - trace.start) * 1000,
+                duration_ms=(end - start) * 1000,
+            )
+        )
+
+
+def is_authorized(token: str | None) -> bool:
+    """Check a token against the configured profiling token.
+
+    Args:
+        token (str | None): The token given by the client.
+
+    Returns:
+        bool: True if profiling is configured with the given token.
+    """
+    if not PROFILING_TOKEN or not token:
+        return False
+    return secrets.compare_digest(token, PROFILING_TOKEN)
+
+
+def _should_profile(scope: Scope) -> bool:
+    """Decide whether to run the profiler for a request.
+
+    Args:
+        scope (Scope): The ASGI scope of the incoming request.
+
+    Returns:
+        bool: True if the request should be profiled.
+    """
+    if PROFILING_TOKEN and is_authorized(
+        Headers(scope=scope).get(PROFILING_TOKEN_HEADER)
+    ):
+        return True
+    return random.random() < PROFILING_SAMPLE_RATE  # noqa: S311
+
+
+def _start_profiler() -> cProfile.Profile | None:
+    """Start the profiler if this is the only request in flight.
+
+    Returns:
+        cProfile.Profile | None: The running profiler, or None if busy.
+    """
+    global _profiler
+    if _in_flight != 1 or _profiler is not None:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiling tool is active
+        return None
+    _profiler = profiler
+    return profiler
+
+
+def _interrupt_profiler() -> None:
+    """Stop the running profiler, if any, because another request started."""
+    global _profiler
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler = None
+
+
+def _stop_profiler(profiler: cProfile.Profile) -> str:
+    """Stop the profiler and format its statistics.
+
+    Args:
+        profiler (cProfile.Profile): The profiler started for this request.
+
+    Returns:
+        str: The top functions sorted by cumulative time.
+    """
+    global _profiler
+    stream = io.StringIO()
+    if _profiler is profiler:
+        profiler.disable()
+        _profiler = None
+    else:
+        stream.write(PROFILE_INTERRUPTED)
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_LINES)
+    return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that traces profiled and, if enabled, slow requests."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Wrap an ASGI app.
+
+        Args:
+            app (ASGIApp): The app to wrap.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Count requests in flight and trace them.
+
+        Requests to the admin endpoint are not traced, so reading the ring
+        buffer does not push other requests out of it.
+
+        Args:
+            scope (Scope): The ASGI scope.
+            receive (Receive): The ASGI receive channel.
+            send (Send): The ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global _in_flight
+        _in_flight += 1
+        _interrupt_profiler()
+        try:
+            traced = scope["path"] != ADMIN_PATH
+            profiled = traced and _should_profile(scope)
+            if profiled or (traced and SLOW_REQUEST_THRESHOLD_MS > 0):
+                await self._trace(scope, receive, send, profiled)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            _in_flight -= 1
+
+    async def _trace(
+        self, scope: Scope, receive: Receive, send: Send, profiled: bool
+    ) -> None:
+        """Trace the request and record it if profiled or slow.
+
+        Args:
+            scope (Scope): The ASGI scope.
+            receive (Receive): The ASGI receive channel.
+            send (Send): The ASGI send channel.
+            profiled (bool): Whether to run the profiler.
+        """
+        record_id = uuid4()
+        status_code = 500
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profiled:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (PROFILE_ID_HEADER.lower().encode(), str(record_id).encode()),
+                    ]
+            await send(message)
+
+        trace = _Trace()
+        context_token = _current_trace.set(trace)
+        profiler = _start_profiler() if profiled else None
+        profile = None
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if profiler:
+                profile = _stop_profiler(profiler)
+            _current_trace.reset(context_token)
+        duration_ms = (time.perf_counter() - trace.start) * 1000
+
+        if profiled or 0 < SLOW_REQUEST_THRESHOLD_MS <= duration_ms:
+            slow_requests.append(
+                RequestTrace(
+                    id=record_id,
+                    timestamp=datetime.now(timezone.utc),
+                    method=scope["method"],
+                    path=scope["path"],
+                    status_code=status_code,
+                    duration_ms=duration_ms,
+                    spans=trace.spans,
+                    profile=profile,
+                )
+            )
@@ -1,2 +1,11 @@
 """Repository package for photo_api."""
 from .photos import add_photo, get_photo, get_photos
+from .uploads import (
+    add_upload_chunk,
+    complete_upload,
+    create_upload,
+    delete_upload,
+    get_upload,
+    UploadConflictError,
+    UploadNotFoundError,
+)
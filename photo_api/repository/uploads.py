@@ -0,0 +1,323 @@
+"""This module contains functions for resumable uploads stored in the database.
+
+An upload is a session with a known total size. Its chunks are written to the
+database as they arrive, at any offset and in any order, and are concatenated
+into a photo when the upload is completed.
+
+Sessions that have not received a chunk for UPLOAD_EXPIRY_SECONDS are deleted
+whenever an upload is created, completed or deleted. There is no background
+job, so expired sessions stay in the database until one of those happens.
+"""
+import os
+from uuid import UUID
+
+import psycopg
+from psycopg import sql
+
+from .photos import (
+    POSTGRES_DB,
+    POSTGRES_HOST,
+    POSTGRES_PASSWORD,
+    POSTGRES_PORT,
+    POSTGRES_SCHEMA,
+    POSTGRES_SSLMODE,
+    POSTGRES_USER,
+)
+from ..models import Upload
+
+UPLOAD_EXPIRY_SECONDS = int(os.getenv("UPLOAD_EXPIRY_SECONDS", 24 * 60 * 60))
+
+
+class UploadNotFoundError(Exception):
+    """The upload does not exist."""
+
+
+class UploadConflictError(Exception):
+    """The chunk overlaps another chunk, or the upload is incomplete."""
+
+
+async def _connect() -> psycopg.AsyncConnection:
+    """Connect to the database.
+
+    Returns:
+        psycopg.AsyncConnection: A connection in a transaction.
+    """
+    return await psycopg.AsyncConnection.connect(
+        f"host={POSTGRES_HOST}"
+        f" port={POSTGRES_PORT}"
+        f" sslmode={POSTGRES_SSLMODE}"
+        f" dbname={POSTGRES_DB}"
+        f" user={POSTGRES_USER}"
+        f" password={POSTGRES_PASSWORD}",
+        autocommit=False,
+    )
+
+
+async def _create_tables(cur: psycopg.AsyncCursor) -> None:
+    """Create the schema and tables used by uploads.
+
+    Args:
+        cur (psycopg.AsyncCursor): A cursor.
+    """
+    await cur.execute(
+        sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(
+            sql.Identifier(POSTGRES_SCHEMA)
+        )
+    )
+    await cur.execute(
+        sql.SQL(
+            """
+        CREATE TABLE IF NOT EXISTS {}.photos
+        (id uuid PRIMARY KEY, filename VARCHAR(250), size INTEGER, photo BYTEA);
+        """
+        ).format(sql.Identifier(POSTGRES_SCHEMA)),
+    )
+    await cur.execute(
+        sql.SQL(
+            """
+        CREATE TABLE IF NOT EXISTS {0}.uploads
+        (id uuid PRIMARY KEY, filename VARCHAR(250), size BIGINT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now());
+        CREATE TABLE IF NOT EXISTS {0}.upload_chunks
+        (upload_id uuid REFERENCES {0}.uploads (id) ON DELETE CASCADE,
+        chunk_offset BIGINT, data BYTEA, PRIMARY KEY (upload_id, chunk_offset));
+        """
+        ).format(sql.Identifier(POSTGRES_SCHEMA)),
+    )
+
+
+async def _lock_upload(cur: psycopg.AsyncCursor, id: str) -> int:
+    """Lock an upload for the rest of the transaction.
+
+    Args:
+        cur (psycopg.AsyncCursor): A cursor.
+        id (str): The uuid of the upload.
+
+    Returns:
+        int: The total size of the upload.
+
+    Raises:
+        UploadNotFoundError: If the upload does not exist.
+    """
+    await cur.execute(
+        sql.SQL("SELECT size FROM {}.uploads WHERE id = %s FOR UPDATE;").format(
+            sql.Identifier(POSTGRES_SCHEMA)
+        ),
+        (id,),
+    )
+    result = await cur.fetchone()
+    if not result:
+        raise UploadNotFoundError(id)
+    return result[0]
+
+
+async def _received_offset(cur: psycopg.AsyncCursor, id: str) -> int:
+    """Get the number of contiguous bytes received from the start of an upload.
+
+    Args:
+        cur (psycopg.AsyncCursor): A cursor.
+        id (str): The uuid of the upload.
+
+    Returns:
+        int: The offset of the first missing byte.
+    """
+    await cur.execute(
+        sql.SQL(
+            "SELECT chunk_offset, length(data) FROM {}.upload_chunks"
+            " WHERE upload_id = %s ORDER BY chunk_offset;"
+        ).format(sql.Identifier(POSTGRES_SCHEMA)),
+        (id,),
+    )
+    offset = 0
+    for chunk_offset, length in await cur.fetchall():
+        if chunk_offset > offset:
+            break
+        offset = max(offset, chunk_offset + length)
+    return offset
+
+
+async def _delete_expired_uploads(cur: psycopg.AsyncCursor) -> None:
+    """Delete uploads that have not received a chunk for UPLOAD_EXPIRY_SECONDS.
+
+    Args:
+        cur (psycopg.AsyncCursor): A cursor.
+    """
+    await cur.execute(
+        sql.SQL(
+            "DELETE FROM {}.uploads"
+            " WHERE updated_at < now() - make_interval(secs => %s);"
+        ).format(sql.Identifier(POSTGRES_SCHEMA)),
+        (UPLOAD_EXPIRY_SECONDS,),
+    )
+
+
+async def create_upload(upload: Upload) -> UUID:
+    """Add an upload to the database and delete expired uploads.
+
+    Args:
+        upload (Upload): An upload object.
+
+    Returns:
+        UUID: The uuid of the upload added.
+    """
+    async with await _connect() as aconn:
+        async with aconn.cursor() as cur:
+            await _create_tables(cur)
+            await _delete_expired_uploads(cur)
+            await cur.execute(
+                sql.SQL(
+                    "INSERT INTO {}.uploads (id, filename, size) VALUES(%s, %s, %s)"
+                ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                (upload.id, upload.filename, upload.size),
+            )
+            return upload.id
+
+
+async def get_upload(id: str) -> Upload | None:
+    """Get an upload and its received offset from the database.
+
+    Args:
+        id (str): The uuid of the upload.
+
+    Returns:
+        Upload: An upload with the given id.
+    """
+    async with await _connect() as aconn:
+        async with aconn.cursor() as cur:
+            await _create_tables(cur)
+            await cur.execute(
+                sql.SQL(
+                    "SELECT id, filename, size FROM {}.uploads WHERE id = %s;"
+                ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                (id,),
+            )
+            result = await cur.fetchone()
+            if not result:
+                return None
+            offset = await _received_offset(cur, id)
+            return Upload(
+                id=result[0], filename=result[1], size=result[2], offset=offset
+            )
+
+
+async def add_upload_chunk(id: str, offset: int, data: bytes) -> int:
+    """Write a chunk of an upload to the database.
+
+    A chunk sent again at the same offset replaces the previous one. Raises
+    UploadNotFoundError if the upload does not exist.
+
+    Args:
+        id (str): The uuid of the upload.
+        offset (int): The offset of the chunk in the upload.
+        data (bytes): The content of the chunk.
+
+    Returns:
+        int: The received offset of the upload after adding the chunk.
+
+    Raises:
+        ValueError: If the chunk is outside the upload.
+        UploadConflictError: If the chunk overlaps another chunk.
+    """
+    async with await _connect() as aconn:
+        async with aconn.cursor() as cur:
+            await _create_tables(cur)
+            size = await _lock_upload(cur, id)
+            end = offset + len(data)
+            if offset < 0 or end > size:
+                raise ValueError(f"Chunk {offset}-{end} is outside upload of {size}.")
+            if data:
+                await cur.execute(
+                    sql.SQL(
+                        "SELECT 1 FROM {}.upload_chunks WHERE upload_id = %s"
+                        " AND chunk_offset <> %s AND chunk_offset < %s"
+                        " AND chunk_offset + length(data) > %s;"
+                    ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                    (id, offset, end, offset),
+                )
+                if await cur.fetchone():
+                    raise UploadConflictError(
+                        f"Chunk {offset}-{end} overlaps another chunk."
+                    )
+                await cur.execute(
+                    sql.SQL(
+                        "INSERT INTO {}.upload_chunks (upload_id, chunk_offset, data)"
+                        " VALUES(%s, %s, %s) ON CONFLICT (upload_id, chunk_offset)"
+                        " DO UPDATE SET data = EXCLUDED.data;"
+                    ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                    (id, offset, data),
+                )
+            await cur.execute(
+                sql.SQL(
+                    "UPDATE {}.uploads SET updated_at = now() WHERE id = %s;"
+                ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                (id,),
+            )
+            return await _received_offset(cur, id)
+
+
+async def complete_upload(id: str) -> UUID:
+    """Turn a fully received upload into a photo and delete expired uploads.
+
+    The photo gets the uuid of the upload. Raises UploadNotFoundError if the
+    upload does not exist.
+
+    Args:
+        id (str): The uuid of the upload.
+
+    Returns:
+        UUID: The uuid of the photo added.
+
+    Raises:
+        UploadConflictError: If the upload has not been fully received.
+    """
+    async with await _connect() as aconn:
+        async with aconn.cursor() as cur:
+            await _create_tables(cur)
+            size = await _lock_upload(cur, id)
+            offset = await _received_offset(cur, id)
+            if offset != size:
+                raise UploadConflictError(f"Received {offset} of {size} bytes.")
+            await cur.execute(
+                sql.SQL(
+                    """
+                INSERT INTO {0}.photos (id, filename, size, photo)
+                SELECT %s, u.filename, u.size, COALESCE(
+                    (SELECT string_agg(c.data, ''::bytea ORDER BY c.chunk_offset)
+                    FROM {0}.upload_chunks c WHERE c.upload_id = u.id),
+                    ''::bytea)
+                FROM {0}.uploads u WHERE u.id = %s;
+                """
+                ).format(sql.Identifier(POSTGRES_SCHEMA)),
+                (id, id),
+            )
+            await cur.execute(
+                sql.SQL("DELETE FROM {}.uploads WHERE id = %s;").format(
+                    sql.Identifier(POSTGRES_SCHEMA)
+                ),
+                (id,),
+            )
+            await _delete_expired_uploads(cur)
+            return UUID(id)
+
+
+async def delete_upload(id: str) -> bool:
+    """Delete an upload and its chunks, and delete expired uploads.
+
+    Args:
+        id (str): The uuid of the upload.
+
+    Returns:
+        bool: True if the upload was deleted.
+    """
+    async with await _connect() as aconn:
+        async with aconn.cursor() as cur:
+            await _create_tables(cur)
+            await cur.execute(
+                sql.SQL("DELETE FROM {}.uploads WHERE id = %s;").format(
+                    sql.Identifier(POSTGRES_SCHEMA)
+                ),
+                (id,),
+            )
+            deleted = cur.rowcount > 0
+            await _delete_expired_uploads(cur)
+            return deleted
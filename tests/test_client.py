@@ -0,0 +1,316 @@
+"""Test module for client.py."""
+import asyncio
+import pathlib
+from typing import Any, AsyncIterator
+import uuid
+
+import httpx
+import pytest
+
+from photo_api.client import PhotoClient
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """Use anyio as the async backend.
+
+    Returns:
+        str: The async backend.
+    """
+    return "asyncio"
+
+
+def client_for(handler, **kwargs: Any) -> PhotoClient:
+    """Return a client that sends its requests to handler.
+
+    Returns:
+        PhotoClient: The client.
+    """
+    return PhotoClient(
+        "http://test", transport=httpx.MockTransport(handler), backoff=0, **kwargs
+    )
+
+
+@pytest.mark.anyio
+async def test_retry_unavailable() -> None:
+    """Should retry a request while the server is unavailable."""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json=[])
+
+    async with client_for(handler) as client:
+        photos = await client.get_photos()
+    assert photos == []
+    assert len(attempts) == 3
+
+
+@pytest.mark.anyio
+async def test_retry_exhausted() -> None:
+    """Should raise when the server is unavailable after all retries."""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        raise httpx.ConnectError("refused", request=request)
+
+    async with client_for(handler, retries=2) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get_photos()
+    assert len(attempts) == 3
+
+
+@pytest.mark.anyio
+async def test_get_photo_not_found() -> None:
+    """Should return None without retrying when the photo is not found."""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        return httpx.Response(404, json={"detail": "Photo not found."})
+
+    async with client_for(handler) as client:
+        photo = await client.get_photo(uuid.uuid4())
+    assert photo is None
+    assert len(attempts) == 1
+
+
+@pytest.mark.anyio
+async def test_upload_file(tmp_path: pathlib.Path) -> None:
+    """Should send the file in chunks and complete the upload."""
+    data = bytes(range(256)) * 10
+    path = tmp_path / "img.png"
+    path.write_bytes(data)
+    upload_id = uuid.uuid4()
+    photo_id = uuid.uuid4()
+    chunks = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST" and request.url.path == "/uploads":
+            return httpx.Response(
+                201,
+                json={"id": str(upload_id)},
+                headers={"Location": f"/uploads/{upload_id}"},
+            )
+        if request.method == "PATCH":
+            chunks[int(request.headers["Upload-Offset"])] = request.content
+            return httpx.Response(204)
+        assert request.url.path == f"/uploads/{upload_id}/complete"
+        return httpx.Response(201, json={"id": str(photo_id)})
+
+    async with client_for(handler, max_concurrency=2) as client:
+        id = await client.upload_file(path, chunk_size=1000)
+    assert id == photo_id
+    assert sorted(chunks) == [0, 1000, 2000]
+    assert b"".join(chunks[offset] for offset in sorted(chunks)) == data
+
+
+@pytest.mark.anyio
+async def test_download_files(tmp_path: pathlib.Path) -> None:
+    """Should download each photo to a file named by its uuid."""
+    contents = {str(uuid.uuid4()): str(i).encode() * 100 for i in range(5)}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        id = request.url.path.split("/")[2]
+        return httpx.Response(200, content=contents[id])
+
+    async with client_for(handler, max_concurrency=2) as client:
+        paths = await client.download_files(contents, tmp_path)
+    assert paths == [tmp_path / id for id in contents]
+    for id, path in zip(contents, paths, strict=True):
+        assert path.read_bytes() == contents[id]
+
+
+@pytest.mark.anyio
+async def test_download_files_missing_directory(tmp_path: pathlib.Path) -> None:
+    """Should create the directory to download to."""
+    directory = tmp_path / "photos" / "copies"
+    id = str(uuid.uuid4())
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=b"data")
+
+    async with client_for(handler) as client:
+        paths = await client.download_files([id], directory)
+    assert paths == [directory / id]
+    assert paths[0].read_bytes() == b"data"
+
+
+@pytest.mark.anyio
+async def test_upload_not_retried_after_send() -> None:
+    """Should not retry creating a photo once the request has been sent."""
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        raise httpx.ReadTimeout("timeout", request=request)
+
+    async with client_for(handler) as client:
+        with pytest.raises(httpx.ReadTimeout):
+            await client.upload(b"data", "img.png")
+    assert len(attempts) == 1
+
+
+@pytest.mark.anyio
+async def test_upload_retried_before_send() -> None:
+    """Should retry creating a photo when the connection failed."""
+    photo_id = uuid.uuid4()
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(201, json={"id": str(photo_id)})
+
+    async with client_for(handler) as client:
+        id = await client.upload(b"data", "img.png")
+    assert id == photo_id
+    assert len(attempts) == 2
+
+
+@pytest.mark.anyio
+async def test_upload_file_complete_response_lost(tmp_path: pathlib.Path) -> None:
+    """Should find the photo when a retried complete finds the upload gone."""
+    path = tmp_path / "img.png"
+    path.write_bytes(b"data")
+    upload_id = uuid.uuid4()
+    completes = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST" and request.url.path == "/uploads":
+            return httpx.Response(
+                201,
+                json={"id": str(upload_id)},
+                headers={"Location": f"/uploads/{upload_id}"},
+            )
+        if request.method == "PATCH":
+            return httpx.Response(204)
+        if request.url.path == f"/uploads/{upload_id}/complete":
+            completes.append(request)
+            if len(completes) == 1:
+                raise httpx.ReadTimeout("timeout", request=request)
+            return httpx.Response(404, json={"detail": "Upload not found."})
+        assert request.url.path == f"/photos/{upload_id}"
+        return httpx.Response(
+            200, json={"id": str(upload_id), "filename": "img.png", "size": 4}
+        )
+
+    async with client_for(handler) as client:
+        id = await client.upload_file(path)
+    assert id == upload_id
+    assert len(completes) == 2
+
+
+@pytest.mark.anyio
+async def test_upload_files_bounded(tmp_path: pathlib.Path) -> None:
+    """Should keep at most max_concurrency transfers in flight for the client."""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"img_{i}.png"
+        path.write_bytes(b"x" * 4000)
+        paths.append(path)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if request.method == "POST" and request.url.path == "/uploads":
+            id = uuid.uuid4()
+            return httpx.Response(
+                201, json={"id": str(id)}, headers={"Location": f"/uploads/{id}"}
+            )
+        if request.method == "PATCH":
+            return httpx.Response(204)
+        return httpx.Response(201, json={"id": str(uuid.uuid4())})
+
+    async with client_for(handler, max_concurrency=2) as client:
+        ids = await client.upload_files(paths, chunk_size=1000)
+    assert len(ids) == 4
+    assert max_in_flight == 2
+
+
+@pytest.mark.anyio
+async def test_download_files_failure(tmp_path: pathlib.Path) -> None:
+    """Should cancel the other downloads and leave no files when one fails."""
+    ids = [str(uuid.uuid4()) for _ in range(4)]
+    completed = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        id = request.url.path.split("/")[2]
+        if id == ids[0]:
+            return httpx.Response(404, json={"detail": "Photo not found"})
+        await asyncio.sleep(0.05)
+        completed.append(id)
+        return httpx.Response(200, content=b"data")
+
+    async with client_for(handler) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.download_files(ids, tmp_path)
+    await asyncio.sleep(0.1)
+    assert completed == []
+    assert list(tmp_path.iterdir()) == []
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """A response body that fails after the first chunk."""
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        """Yield one chunk and fail.
+
+        Yields:
+            bytes: The first chunk.
+
+        Raises:
+            ReadError: Always, after the first chunk.
+        """
+        yield b"data"
+        raise httpx.ReadError("connection lost")
+
+
+@pytest.mark.anyio
+async def test_download_file_failure(tmp_path: pathlib.Path) -> None:
+    """Should not leave a partial file when the download fails."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=BrokenStream())
+
+    async with client_for(handler, retries=1) as client:
+        with pytest.raises(httpx.ReadError):
+            await client.download_file(uuid.uuid4(), tmp_path / "img.png")
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.anyio
+async def test_upload_file_chunk_retried(tmp_path: pathlib.Path) -> None:
+    """Should retry a chunk whose response was lost."""
+    path = tmp_path / "img.png"
+    path.write_bytes(b"data")
+    upload_id = uuid.uuid4()
+    patches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST" and request.url.path == "/uploads":
+            return httpx.Response(
+                201,
+                json={"id": str(upload_id)},
+                headers={"Location": f"/uploads/{upload_id}"},
+            )
+        if request.method == "PATCH":
+            patches.append(request)
+            if len(patches) == 1:
+                raise httpx.ReadTimeout("timeout", request=request)
+            return httpx.Response(204)
+        return httpx.Response(201, json={"id": str(upload_id)})
+
+    async with client_for(handler) as client:
+        id = await client.upload_file(path)
+    assert id == upload_id
+    assert len(patches) == 2
@@ -2,7 +2,7 @@
 import os
 import pathlib
 import time
-from typing import Any, Generator
+from typing import Any, AsyncIterator, Generator
 import uuid
 
 import docker
@@ -186,3 +186,116 @@ async def test_get_photo_not_found(database) -> None:
     assert response.headers["content-type"] == "application/json"
     assert type(response.json()) is dict
     assert response.json()["detail"] == "Photo not found."
+
+
+@pytest.mark.anyio
+async def test_resumable_upload(database, image_file) -> None:
+    """Should assemble chunks sent out of order into a photo."""
+    with open(image_file, "rb") as image:
+        data = image.read()
+    middle = len(data) // 2
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/uploads", json={"filename": "img.png", "size": len(data)}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        location = response.headers["Location"]
+        assert location == f"/uploads/{response.json()['id']}"
+
+        response = await client.patch(
+            location, content=data[middle:], headers={"Upload-Offset": str(middle)}
+        )
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.headers["Upload-Offset"] == "0"
+
+        response = await client.head(location)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Upload-Offset"] == "0"
+        assert response.headers["Upload-Length"] == str(len(data))
+
+        response = await client.patch(
+            location, content=data[:middle], headers={"Upload-Offset": "0"}
+        )
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.headers["Upload-Offset"] == str(len(data))
+
+        response = await client.post(f"{location}/complete")
+        assert response.status_code == status.HTTP_201_CREATED
+        photo_location = response.headers["Location"]
+        assert photo_location == f"/photos/{response.json()['id']}"
+        assert photo_location == location.replace("/uploads/", "/photos/")
+
+        response = await client.get(f"{photo_location}/download")
+        assert response.content == data
+
+        response = await client.head(location)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.anyio
+async def test_resumable_upload_conflicts(database) -> None:
+    """Should reject overlapping chunks and completing an incomplete upload."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/uploads", json={"filename": "a", "size": 10})
+        location = response.headers["Location"]
+        response = await client.patch(
+            location, content=b"01234", headers={"Upload-Offset": "0"}
+        )
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        response = await client.patch(
+            location, content=b"4567", headers={"Upload-Offset": "4"}
+        )
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+        response = await client.patch(
+            location, content=b"56789X", headers={"Upload-Offset": "5"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+        response = await client.post(f"{location}/complete")
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+        response = await client.delete(location)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = await client.patch(
+            location, content=b"56789", headers={"Upload-Offset": "5"}
+        )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.anyio
+async def test_resumable_upload_too_large() -> None:
+    """Should reject an upload larger than a photo can be stored."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/uploads", json={"filename": "a", "size": 1000 * 1000 * 1000 + 1}
+        )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.anyio
+async def test_resumable_upload_chunk_too_large(database, monkeypatch) -> None:
+    """Should reject a chunk larger than the maximum chunk size."""
+    monkeypatch.setattr("photo_api.main.MAX_CHUNK_SIZE", 4)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/uploads", json={"filename": "a", "size": 10})
+        location = response.headers["Location"]
+        response = await client.patch(
+            location, content=b"01234", headers={"Upload-Offset": "0"}
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        async def body() -> AsyncIterator[bytes]:
+            yield b"012"
+            yield b"34"
+
+        response = await client.patch(
+            location, content=body(), headers={"Upload-Offset": "0"}
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        response = await client.patch(
+            f"/uploads/{uuid.uuid4()}", content=b"0", headers={"Upload-Offset": "0"}
+        )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,187 @@
+"""Test module for profiling.py."""
+import asyncio
+from collections import deque
+
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+import pytest
+
+from photo_api import profiling
+from photo_api.main import app, get_slow_requests_handler
+from photo_api.profiling import span
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """Use anyio as the async backend.
+
+    Returns:
+        str: The async backend.
+    """
+    return "asyncio"
+
+
+@pytest.fixture
+def profiled_app(monkeypatch: pytest.MonkeyPatch) -> FastAPI:
+    """Return an app with the profiling middleware and a fresh ring buffer.
+
+    Returns:
+        FastAPI: The app.
+    """
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILING_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_THRESHOLD_MS", 0.0)
+    monkeypatch.setattr(profiling, "slow_requests", deque(maxlen=2))
+
+    test_app = FastAPI()
+    test_app.add_middleware(profiling.ProfilingMiddleware)
+    test_app.get(profiling.ADMIN_PATH)(get_slow_requests_handler)
+
+    @test_app.get("/work")
+    async def work() -> dict[str, str]:
+        with span("work"):
+            pass
+        return {"message": "done"}
+
+    return test_app
+
+
+def test_span_without_trace_is_noop() -> None:
+    """Should do nothing outside a traced request."""
+    with span("nothing"):
+        pass
+    assert len(profiling.slow_requests) == 0
+
+
+@pytest.mark.anyio
+async def test_untraced_request(profiled_app) -> None:
+    """Should not record requests that are neither profiled nor slow."""
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        response = await client.get("/work")
+    assert response.status_code == status.HTTP_200_OK
+    assert profiling.PROFILE_ID_HEADER not in response.headers
+    assert len(profiling.slow_requests) == 0
+
+
+@pytest.mark.anyio
+async def test_untraced_request_no_trace(profiled_app) -> None:
+    """Should not allocate a trace for requests that are not profiled."""
+    traces = []
+
+    @profiled_app.get("/trace")
+    async def trace() -> dict[str, str]:
+        traces.append(profiling._current_trace.get())
+        return {"message": "done"}
+
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        await client.get("/trace")
+        await client.get("/trace", headers={profiling.PROFILING_TOKEN_HEADER: "secret"})
+    assert traces[0] is None
+    assert traces[1] is not None
+
+
+@pytest.mark.anyio
+async def test_profiled_request(profiled_app) -> None:
+    """Should record spans and profile when given the profiling token."""
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        response = await client.get(
+            "/work", headers={profiling.PROFILING_TOKEN_HEADER: "secret"}
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(profiling.slow_requests) == 1
+    record = profiling.slow_requests[0]
+    assert response.headers[profiling.PROFILE_ID_HEADER] == str(record.id)
+    assert record.path == "/work"
+    assert record.status_code == status.HTTP_200_OK
+    assert [s.name for s in record.spans] == ["work"]
+    assert record.profile
+
+
+@pytest.mark.anyio
+async def test_slow_requests_ring_buffer(profiled_app, monkeypatch) -> None:
+    """Should keep only the most recent slow requests."""
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_THRESHOLD_MS", 1e-9)
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        for _ in range(3):
+            await client.get("/work")
+    assert len(profiling.slow_requests) == 2
+    assert all(record.profile is None for record in profiling.slow_requests)
+
+
+@pytest.mark.anyio
+async def test_get_slow_requests(profiled_app) -> None:
+    """Should return the ring buffer only when given the profiling token."""
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        await client.get("/work", headers={profiling.PROFILING_TOKEN_HEADER: "secret"})
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/admin/slow-requests")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await client.get(
+            "/admin/slow-requests",
+            headers={profiling.PROFILING_TOKEN_HEADER: "secret"},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    assert response.json()[0]["path"] == "/work"
+
+
+@pytest.mark.anyio
+async def test_get_slow_requests_not_traced(profiled_app) -> None:
+    """Should not record reads of the ring buffer in the ring buffer."""
+    headers = {profiling.PROFILING_TOKEN_HEADER: "secret"}
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        await client.get("/work", headers=headers)
+        for _ in range(2):
+            response = await client.get(profiling.ADMIN_PATH, headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+            assert profiling.PROFILE_ID_HEADER not in response.headers
+    assert [record.path for record in profiling.slow_requests] == ["/work"]
+
+
+@pytest.mark.anyio
+async def test_profiled_request_interrupted(profiled_app) -> None:
+    """Should stop profiling when another request starts."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    @profiled_app.get("/wait")
+    async def wait() -> dict[str, str]:
+        started.set()
+        await release.wait()
+        return {"message": "done"}
+
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        profiled = asyncio.create_task(
+            client.get("/wait", headers={profiling.PROFILING_TOKEN_HEADER: "secret"})
+        )
+        await started.wait()
+        await client.get("/work")
+        release.set()
+        await profiled
+    assert len(profiling.slow_requests) == 1
+    record = profiling.slow_requests[0]
+    assert record.profile is not None
+    assert record.profile.startswith(profiling.PROFILE_INTERRUPTED)
+
+
+@pytest.mark.anyio
+async def test_concurrent_request_not_profiled(profiled_app) -> None:
+    """Should not profile a request while another request is in flight."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    @profiled_app.get("/wait")
+    async def wait() -> dict[str, str]:
+        started.set()
+        await release.wait()
+        return {"message": "done"}
+
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        waiting = asyncio.create_task(client.get("/wait"))
+        await started.wait()
+        await client.get("/work", headers={profiling.PROFILING_TOKEN_HEADER: "secret"})
+        release.set()
+        await waiting
+    assert len(profiling.slow_requests) == 1
+    assert profiling.slow_requests[0].path == "/work"
+    assert profiling.slow_requests[0].profile is None